@@ -5,9 +5,53 @@ Reads data/network.json and outputs frontend/public/graph.json
 """
 
 import json
+import mmap
 import sys
 from pathlib import Path
 
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib json module
+    orjson = None
+
+try:
+    import ijson
+except ImportError:  # ijson is optional, without it the whole file is parsed at once
+    ijson = None
+
+# Edges are packed into one uint64 as source_idx << 32 | target_idx
+EDGE_SHIFT = np.uint64(32)
+EDGE_MASK = np.uint64(0xFFFFFFFF)
+
+
+def load_network(network_file):
+    """Parse the scraped network file, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(network_file.read_bytes())
+    with open(network_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def iter_users(network_file):
+    """Yield users from the scraped network file one at a time, streaming it with ijson when installed"""
+    if ijson is None:
+        yield from load_network(network_file)['users']
+        return
+    with open(network_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        yield from ijson.items(mm, 'users.item')
+
+
+def write_graph(graph_data, output_file):
+    """Write compact graph JSON for the frontend, using orjson when it is installed"""
+    if orjson is not None:
+        output_file.write_bytes(orjson.dumps(graph_data))
+        return
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(graph_data, f, ensure_ascii=False, separators=(',', ':'))
+
+
 def process_network_graph():
     # Read the network data
     network_file = Path("data/network.json")
@@ -15,166 +59,143 @@ def process_network_graph():
         print(f"Error: {network_file} not found")
         sys.exit(1)
     
-    with open(network_file, 'r', encoding='utf-8') as f:
-        raw_data = json.load(f)
+    print(f"Processing users from {network_file}...")
     
-    print(f"Processing {len(raw_data['users'])} users...")
+    # Potential nodes as parallel arrays indexed through id_to_idx (we'll filter later)
+    id_to_idx = {}
+    ids = []
+    usernames = []
+    follower_counts = []
+    following_counts = []
     
-    # Create potential nodes map (we'll filter later)
-    potential_nodes = {}
+    # Create simple edges without type tracking, each packed as source_idx << 32 | target_idx.
+    # Users are streamed, so each user's edges are kept as one array and joined at the end.
+    edge_chunks = []
     
-    # First pass: identify high-activity users to filter out
+    # Single pass: filter high-activity users, collect nodes and edges together
     filtered_user_ids = set()
     filtered_count = 0
+    user_count = 0
     
-    for user in raw_data['users']:
+    for user in iter_users(network_file):
+        user_count += 1
+        user_id = user['user_id']
+        follower_count = user['follower_count']
+        following_count = user['following_count']
+        
         # Identify users with 900+ followers or following
-        if user['follower_count'] >= 900 or user['following_count'] >= 900:
-            filtered_user_ids.add(user['user_id'])
+        if follower_count >= 900 or following_count >= 900:
+            filtered_user_ids.add(user_id)
             filtered_count += 1
-    
-    print(f"Identified {filtered_count} high-activity users to filter out")
-    
-    # Add all main users (excluding high-activity users)
-    for user in raw_data['users']:
-        if user['user_id'] not in filtered_user_ids:
-            potential_nodes[user['user_id']] = {
-                'id': user['user_id'],
-                'username': user['username'],
-                'follower_count': user['follower_count'],
-                'following_count': user['following_count']
-            }
-    
-    # Add referenced users (from followers/following lists)
-    # Only add if the main user wasn't filtered out
-    for user in raw_data['users']:
-        # Skip if this user was filtered out
-        if user['user_id'] not in potential_nodes:
             continue
-            
-        # Add followers (we don't have their full data, so we assume they're under threshold)
+        
+        # Main user data always wins over a placeholder added by an earlier reference
+        idx = id_to_idx.setdefault(user_id, len(ids))
+        if idx == len(ids):
+            ids.append(user_id)
+            usernames.append(user['username'])
+            follower_counts.append(follower_count)
+            following_counts.append(following_count)
+        else:
+            usernames[idx] = user['username']
+            follower_counts[idx] = follower_count
+            following_counts[idx] = following_count
+        
+        # Add followers (follower -> main user)
+        follower_idxs = []
         for follower in user['followers']:
-            if follower['id'] not in potential_nodes:
-                potential_nodes[follower['id']] = {
-                    'id': follower['id'],
-                    'username': follower['name'],
-                    'follower_count': 0,
-                    'following_count': 0
-                }
+            follower_id = follower['id']
+            follower_idx = id_to_idx.setdefault(follower_id, len(ids))
+            if follower_idx == len(ids):
+                ids.append(follower_id)
+                usernames.append(follower['name'])
+                follower_counts.append(0)
+                following_counts.append(0)
+            follower_idxs.append(follower_idx)
+        
+        edge_chunks.append(np.array(follower_idxs, dtype=np.uint64) << EDGE_SHIFT | np.uint64(idx))
         
         # Add following (we don't have their full data, so we assume they're under threshold)
+        following_idxs = []
         for following in user['following']:
-            if following['id'] not in potential_nodes:
-                potential_nodes[following['id']] = {
-                    'id': following['id'],
-                    'username': following['name'],
-                    'follower_count': 0,
-                    'following_count': 0
-                }
-    
-    print(f"Created {len(potential_nodes)} potential nodes")
-    
-    # Create simple edges without type tracking
-    edges = set()  # Use set to avoid duplicates
-    
-    # Process following relationships to create edges (skip filtered users)
-    for user in raw_data['users']:
-        # Skip if this user was filtered out
-        if user['user_id'] not in potential_nodes:
-            continue
-            
-        for following in user['following']:
-            # Only create edge if both nodes exist in our filtered set
-            if following['id'] in potential_nodes:
-                edges.add((user['user_id'], following['id']))
-    
-    # Process follower relationships to create edges (follower -> main user)
-    for user in raw_data['users']:
-        # Skip if this user was filtered out
-        if user['user_id'] not in potential_nodes:
-            continue
-            
-        for follower in user['followers']:
-            # Only create edge if both nodes exist in our filtered set
-            if follower['id'] in potential_nodes:
-                edges.add((follower['id'], user['user_id']))
+            following_id = following['id']
+            following_idx = id_to_idx.setdefault(following_id, len(ids))
+            if following_idx == len(ids):
+                ids.append(following_id)
+                usernames.append(following['name'])
+                follower_counts.append(0)
+                following_counts.append(0)
+            following_idxs.append(following_idx)
+        
+        edge_chunks.append(np.uint64(idx) << EDGE_SHIFT | np.array(following_idxs, dtype=np.uint64))
+    
+    print(f"Read {user_count} users")
+    print(f"Identified {filtered_count} high-activity users to filter out")
+    print(f"Created {len(ids)} potential nodes")
+    
+    # Deduplicate the packed edges
+    edges = np.unique(np.concatenate(edge_chunks)) if edge_chunks else np.empty(0, dtype=np.uint64)
     
     print(f"Created {len(edges)} unique edges")
     
-    # Convert edges to simple links
-    links = []
-    for source_id, target_id in edges:
-        links.append({
-            'source': source_id,
-            'target': target_id,
-            'value': 1
-        })
-    
-    print(f"Created {len(links)} links")
-    
-    # Build a connection map to identify nodes only connected to filtered users
-    node_connections = {}
-    for link in links:
-        source_id = link['source']
-        target_id = link['target']
-        
-        if source_id not in node_connections:
-            node_connections[source_id] = set()
-        if target_id not in node_connections:
-            node_connections[target_id] = set()
-            
-        node_connections[source_id].add(target_id)
-        node_connections[target_id].add(source_id)
-    
-    # Find nodes that are only connected to filtered users
-    nodes_only_connected_to_filtered = set()
-    for node_id, connections in node_connections.items():
-        # Skip if this is a filtered user
-        if node_id in filtered_user_ids:
-            continue
-            
-        # Check if ALL connections are to filtered users
-        if connections and all(conn_id in filtered_user_ids for conn_id in connections):
-            nodes_only_connected_to_filtered.add(node_id)
-    
-    print(f"Found {len(nodes_only_connected_to_filtered)} nodes only connected to filtered users")
-    
-    # Remove links involving nodes that are only connected to filtered users
-    filtered_links = []
-    for link in links:
-        source_id = link['source']
-        target_id = link['target']
-        
-        # Skip links involving filtered users or nodes only connected to filtered users
-        if (source_id in filtered_user_ids or 
-            target_id in filtered_user_ids or
-            source_id in nodes_only_connected_to_filtered or
-            target_id in nodes_only_connected_to_filtered):
-            continue
-            
-        filtered_links.append(link)
+    # Keep links as parallel source/target index columns; per-link dicts are only built for output
+    link_sources = (edges >> EDGE_SHIFT).astype(np.uint32)
+    link_targets = (edges & EDGE_MASK).astype(np.uint32)
     
-    print(f"Reduced to {len(filtered_links)} links after filtering")
+    print(f"Created {len(link_sources)} links")
     
-    # Find nodes that are connected (appear in at least one filtered link)
-    connected_node_ids = set()
-    for link in filtered_links:
-        connected_node_ids.add(link['source'])
-        connected_node_ids.add(link['target'])
+    # Filtered users only have a node index if someone else referenced them
+    num_nodes = len(ids)
+    filtered_mask = np.zeros(num_nodes, dtype=bool)
+    filtered_mask[[id_to_idx[user_id] for user_id in filtered_user_ids if user_id in id_to_idx]] = True
+    
+    # Count each node's connections, and how many of them are to filtered users
+    total_degree = (np.bincount(link_sources, minlength=num_nodes)
+                    + np.bincount(link_targets, minlength=num_nodes))
+    filtered_degree = (np.bincount(link_sources[filtered_mask[link_targets]], minlength=num_nodes)
+                       + np.bincount(link_targets[filtered_mask[link_sources]], minlength=num_nodes))
+    
+    # Find nodes (other than filtered users) whose connections are ALL to filtered users
+    only_connected_to_filtered = (total_degree > 0) & (total_degree == filtered_degree) & ~filtered_mask
+    only_connected_count = int(only_connected_to_filtered.sum())
+    
+    print(f"Found {only_connected_count} nodes only connected to filtered users")
+    
+    # Remove links involving filtered users or nodes only connected to filtered users
+    excluded = filtered_mask | only_connected_to_filtered
+    keep = ~(excluded[link_sources] | excluded[link_targets])
+    link_sources = link_sources[keep]
+    link_targets = link_targets[keep]
     
-    # Filter to only include connected nodes
-    nodes = {node_id: potential_nodes[node_id] for node_id in connected_node_ids if node_id in potential_nodes}
+    print(f"Reduced to {len(link_sources)} links after filtering")
     
-    total_filtered = filtered_count + len(nodes_only_connected_to_filtered)
-    print(f"Final network: {len(nodes)} nodes and {len(filtered_links)} links")
-    print(f"Total filtered: {total_filtered} users ({filtered_count} high-activity + {len(nodes_only_connected_to_filtered)} only-connected-to-filtered)")
+    # Find nodes that are connected (appear in at least one filtered link)
+    connected_node_idxs = np.unique(np.concatenate((link_sources, link_targets)))
+    
+    # Filter to only include connected nodes, building node dicts only for those
+    nodes = [
+        {
+            'id': ids[idx],
+            'username': usernames[idx],
+            'follower_count': follower_counts[idx],
+            'following_count': following_counts[idx]
+        }
+        for idx in connected_node_idxs.tolist()
+    ]
+    
+    # Materialize the filtered links for output
+    links = [
+        {'source': ids[source_idx], 'target': ids[target_idx], 'value': 1}
+        for source_idx, target_idx in zip(link_sources.tolist(), link_targets.tolist())
+    ]
     
-    # Update links to use the filtered set
-    links = filtered_links
+    total_filtered = filtered_count + only_connected_count
+    print(f"Final network: {len(nodes)} nodes and {len(links)} links")
+    print(f"Total filtered: {total_filtered} users ({filtered_count} high-activity + {only_connected_count} only-connected-to-filtered)")
     
     # Create final graph structure
     graph_data = {
-        'nodes': list(nodes.values()),
+        'nodes': nodes,
         'links': links,
         'metadata': {
             'total_users': len(nodes),
@@ -189,19 +210,14 @@ def process_network_graph():
     
     # Write processed graph data
     output_file = output_dir / "graph.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(graph_data, f, indent=2, ensure_ascii=False)
+    write_graph(graph_data, output_file)
     
     print(f"Graph data written to {output_file}")
     
     # Print some examples for verification
     print("\nExample connections:")
-    example_links = links[:5]
-    
-    for link in example_links:
-        source_name = nodes[link['source']]['username']
-        target_name = nodes[link['target']]['username']
-        print(f"  {source_name} -> {target_name}")
+    for source_idx, target_idx in zip(link_sources[:5].tolist(), link_targets[:5].tolist()):
+        print(f"  {usernames[source_idx]} -> {usernames[target_idx]}")
 
 if __name__ == "__main__":
     process_network_graph() 
\ No newline at end of file
@@ -1,26 +1,110 @@
 import json
 import sys
 import os
+import asyncio
 from selenium import webdriver
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.chrome.options import Options
-import re 
-from functools import reduce
-from bs4 import BeautifulSoup
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import httpx
 import time
 
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib json module
+    orjson = None
+
 BASE_URL = 'https://open.spotify.com'
 INPUT_FILE = 'scraper/user_ids.txt'
 OUTPUT_FILE = 'data/network.json'
+USERS_FILE = 'data/network.jsonl'
+PROCESSED_FILE = 'data/processed_users.txt'
+USERNAMES_FILE = 'data/usernames.json'
+FSYNC_EVERY = 25
+TOKEN_URL = f'{BASE_URL}/get_access_token?reason=transport&productType=web_player'
+PROFILE_API_URL = 'https://spclient.wg.spotify.com/user-profile-view/v3/profile'
+USER_URI_PREFIX = 'spotify:user:'
+PAGE_LOAD_TIMEOUT = 20
+SCRIPT_TIMEOUT = 20
+COOKIES_FILE = 'scraper/cookies.json'
+LOGIN_TIMEOUT = 300
+
+# Only present in the web player once a user is logged in
+LOGGED_IN_MARKER = (By.CSS_SELECTOR, 'button[data-testid="user-widget-link"], img[data-testid="user-widget-avatar"]')
+MAX_WORKERS = 4
+API_CONCURRENCY = 16
+API_MAX_CONNECTIONS = 32
+# Rate-limited (429) and server error responses are retried with exponential backoff
+API_RETRIES = 5
+API_BACKOFF = 1
+# A longer Retry-After gives up on the user instead, leaving it for a later run
+API_MAX_RETRY_WAIT = 60
+# Tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 60
+
+# Worker browsers run headless and skip assets the scraper never reads.
+# Set BLOCK_RESOURCES to False if Spotify stops rendering the follower cards without them.
+BLOCK_RESOURCES = True
+
+# Follower/following cards rendered on the followers and following pages
+USER_CARD = (By.CSS_SELECTOR, 'p[id^="card-title-spotify:user"]')
+# A list has rendered once it shows any card, including artists, or its empty state.
+# The page title is set by the router before the list data arrives, so it is no signal.
+LIST_RENDERED = (By.CSS_SELECTOR, 'p[id^="card-title-spotify:"], [data-testid="empty-state"]')
+# After the Friends chip is clicked, how long to wait for user cards before treating the list as empty
+FRIENDS_FILTER_TIMEOUT = 2
+USER_CARDS_SCRIPT = """
+return Array.from(document.querySelectorAll('p[id^="card-title-spotify:user"][title]'))
+    .map(p => [p.id, p.title]);
+"""
+
+# The user lists are virtualised: only the cards near the viewport exist in the DOM.
+# Scrolling the last card into view moves whichever container actually scrolls the list.
+SCROLL_SCRIPT = """
+const cards = document.querySelectorAll('p[id^="card-title-spotify:user"]');
+if (cards.length) cards[cards.length - 1].scrollIntoView({block: 'end'});
+"""
+SCROLL_PAUSE = 0.25
+MAX_IDLE_SCROLLS = 3
+
+# Calls the profile API from inside the logged-in web player page, reusing its session.
+# The token is kept on the page between users; the callback gets the JSON or an error.
+IN_PAGE_FETCH_SCRIPT = """
+const [userId, tokenUrl, profileApiUrl, includeProfile, done] = arguments;
+(async () => {
+    if (!window.__scraperToken || window.__scraperToken.expires < Date.now() + 60000) {
+        const response = await fetch(tokenUrl);
+        if (!response.ok) throw new Error('token request failed with ' + response.status);
+        const data = await response.json();
+        window.__scraperToken = {value: data.accessToken, expires: data.accessTokenExpirationTimestampMs};
+    }
+    const headers = {authorization: 'Bearer ' + window.__scraperToken.value};
+    const get = async path => {
+        const response = await fetch(profileApiUrl + '/' + path, {headers});
+        if (!response.ok) throw new Error(path + ' failed with ' + response.status);
+        return response.json();
+    };
+    const [followers, following, profile] = await Promise.all([
+        get(userId + '/followers?market=from_token'),
+        get(userId + '/following?market=from_token'),
+        includeProfile ? get(userId + '?playlist_limit=0&artist_limit=0&episode_limit=0&market=from_token') : null,
+    ]);
+    done({followers, following, profile});
+})().catch(error => done({error: String(error)}));
+"""
+BLOCKED_URLS = ["*.png", "*.jpg", "*.jpeg", "*.webp", "*.svg", "*.woff", "*.woff2", "*.css", "*.mp4", "*i.scdn.co/*"]
 
 def parse_id(id_string):
-    """Parse Spotify ID from the full ID string"""
-    return id_string.split(":")[2].split("-")[0]
+    """Parse Spotify ID from the full ID string ("card-title-spotify:user:<id>-<n>")"""
+    start = id_string.rindex(":") + 1
+    end = id_string.find("-", start)
+    return id_string[start:end] if end != -1 else id_string[start:]
 
-def setup_driver():
+def setup_driver(headless=False, block_resources=False):
     """Setup and return Chrome driver with appropriate options"""
     options = Options()
     options.add_argument("--log-level=1")
@@ -28,10 +112,221 @@ def setup_driver():
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
     
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-dev-shm-usage")
+    if block_resources:
+        options.add_argument("--blink-settings=imagesEnabled=false")
+    
     driver = webdriver.Chrome(options=options)
-    driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    driver.set_script_timeout(SCRIPT_TIMEOUT)
+    
+    if block_resources:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    
+    # Registered once, the override is applied to every page the driver loads from now on
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+        "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
+    })
     return driver
 
+def load_cookies(driver, filename=COOKIES_FILE):
+    """Add cookies saved by an earlier run to the driver, returning whether any were loaded"""
+    try:
+        with open(filename, 'r', encoding='utf-8') as file:
+            cookies = json.load(file)
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        print(f"Error loading saved cookies: {e}")
+        return False
+    
+    for cookie in cookies:
+        try:
+            driver.add_cookie(cookie)
+        except Exception:
+            continue
+    return bool(cookies)
+
+def save_cookies(driver, filename=COOKIES_FILE):
+    """Save the driver's cookies so the next run can skip the manual login"""
+    try:
+        # The session cookies give full access to the account, so only the owner may read them
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(filename, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(driver.get_cookies(), file)
+    except Exception as e:
+        print(f"Error saving cookies: {e}")
+
+def is_logged_in(driver, timeout):
+    """Wait up to timeout seconds for the logged-in user widget to appear"""
+    try:
+        WebDriverWait(driver, timeout).until(EC.presence_of_element_located(LOGGED_IN_MARKER))
+        return True
+    except TimeoutException:
+        return False
+
+def login(driver):
+    """Log in with saved cookies if they are still valid, otherwise wait for a manual login"""
+    print("Opening Spotify homepage...")
+    driver.get(BASE_URL)
+    
+    if load_cookies(driver):
+        driver.refresh()
+        if is_logged_in(driver, 10):
+            print("Logged in with saved cookies")
+            return
+    
+    print("Please log in to Spotify manually in the browser window.")
+    print(f"Waiting up to {LOGIN_TIMEOUT} seconds for the login to complete...")
+    if is_logged_in(driver, LOGIN_TIMEOUT):
+        save_cookies(driver)
+    else:
+        print("Login was not detected, continuing anyway")
+
+class DriverPool:
+    """Gives each worker thread its own Chrome driver, logged in with the given cookies"""
+    
+    def __init__(self, cookies):
+        self.cookies = cookies
+        self.local = threading.local()
+        self.drivers = []
+        self.lock = threading.Lock()
+    
+    def get(self):
+        """Return the calling thread's driver, starting it on first use"""
+        driver = getattr(self.local, 'driver', None)
+        if driver is None:
+            driver = setup_driver(headless=True, block_resources=BLOCK_RESOURCES)
+            with self.lock:
+                self.drivers.append(driver)
+            
+            # Cookies can only be set for the domain that is currently open
+            driver.get(BASE_URL)
+            for cookie in self.cookies:
+                try:
+                    driver.add_cookie(cookie)
+                except Exception:
+                    continue
+            self.local.driver = driver
+        return driver
+    
+    def quit(self):
+        """Close every driver started by the pool"""
+        for driver in self.drivers:
+            driver.quit()
+
+class ApiClient:
+    """An HTTP client authenticated with the browser's session cookies, sharing one bearer token
+    between all concurrent requests"""
+    
+    def __init__(self, cookies):
+        self.http = httpx.AsyncClient(
+            http2=True,
+            cookies={cookie['name']: cookie['value'] for cookie in cookies},
+            timeout=20,
+            limits=httpx.Limits(max_connections=API_MAX_CONNECTIONS)
+        )
+        self.token_expires = 0
+        self.token_lock = asyncio.Lock()
+    
+    async def refresh_access_token(self, stale_token=None):
+        """Exchange the session cookies for a fresh bearer token. Requests that saw the same
+        stale token wait for one refresh instead of each fetching their own."""
+        async with self.token_lock:
+            if stale_token is not None and self.http.headers.get('Authorization') != stale_token:
+                return
+            response = await self.http.get(TOKEN_URL)
+            response.raise_for_status()
+            data = response.json()
+            self.http.headers['Authorization'] = f"Bearer {data['accessToken']}"
+            # Without an expiry the token is only refreshed once the API rejects it
+            expires_ms = data.get('accessTokenExpirationTimestampMs')
+            self.token_expires = expires_ms / 1000 if expires_ms else float('inf')
+    
+    async def get(self, url, params=None):
+        """GET a URL, refreshing the token first if it is about to expire"""
+        if time.time() > self.token_expires - TOKEN_REFRESH_MARGIN:
+            await self.refresh_access_token(self.http.headers.get('Authorization'))
+        return await self.http.get(url, params=params)
+    
+    async def aclose(self):
+        await self.http.aclose()
+
+async def create_api_client(cookies):
+    """Create an API client authenticated with the logged-in browser's session cookies.
+    Returns None if no token could be obtained, in which case pages are scraped with the browser."""
+    client = None
+    try:
+        # Creating the client fails too if the h2 package for HTTP/2 is missing
+        client = ApiClient(cookies)
+        await client.refresh_access_token()
+    except Exception as e:
+        print(f"Could not get an access token, falling back to browser scraping: {e}")
+        if client is not None:
+            await client.aclose()
+        return None
+    return client
+
+def retry_delay(response, retries):
+    """Seconds to wait before retrying, honouring the server's Retry-After header when it sends one"""
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return API_BACKOFF * 2 ** retries
+
+async def api_get(client, path, params):
+    """GET a profile API path, refreshing the token once if it has expired
+    and backing off when rate limited or the server fails"""
+    url = f"{PROFILE_API_URL}/{path}"
+    refreshed = False
+    retries = 0
+    while True:
+        response = await client.get(url, params=params)
+        if response.status_code == 401 and not refreshed:
+            await client.refresh_access_token(response.request.headers.get('Authorization'))
+            refreshed = True
+        elif (response.status_code == 429 or response.status_code >= 500) and retries < API_RETRIES:
+            delay = retry_delay(response, retries)
+            if delay > API_MAX_RETRY_WAIT:
+                print(f"  Asked to wait {delay:.0f} seconds for {path}, leaving it for a later run")
+                response.raise_for_status()
+            print(f"  Got {response.status_code} for {path}, retrying in {delay:.0f} seconds")
+            await asyncio.sleep(delay)
+            retries += 1
+        else:
+            response.raise_for_status()
+            return response.json()
+
+async def fetch_username(user_id, client):
+    """Get the display name/username from a user's profile via the API"""
+    params = {'playlist_limit': 0, 'artist_limit': 0, 'episode_limit': 0, 'market': 'from_token'}
+    try:
+        profile = await api_get(client, user_id, params)
+        return profile.get('name') or user_id
+    except Exception as e:
+        print(f"Error fetching username for {user_id}: {e}")
+        return user_id
+
+def parse_profiles(data):
+    """Convert a followers/following API response into name/id records.
+    Following lists also include artists, which are left out like the Friends chip does on the page."""
+    return [
+        {"name": profile['name'], "id": profile['uri'][len(USER_URI_PREFIX):]}
+        for profile in data.get('profiles', [])
+        if profile['uri'].startswith(USER_URI_PREFIX)
+    ]
+
+async def fetch_profiles(user_id, relation, client):
+    """Fetch the followers or following of a user via the API"""
+    data = await api_get(client, f"{user_id}/{relation}", {'market': 'from_token'})
+    return parse_profiles(data)
+
 def read_user_ids_from_file(filename):
     """Read user IDs from a text file, one per line"""
     try:
@@ -52,18 +347,10 @@ def get_username(user_id, driver, timeout=20):
     try:
         driver.get(profile_url)
         
-        # Wait for the page to load
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        
-        # Wait a bit more for dynamic content
-        time.sleep(2)
-        
         # Try to find the username/display name
         try:
-            # Look for the main heading that contains the user's display name
-            username_element = WebDriverWait(driver, 10).until(
+            # Wait for the main heading that contains the user's display name
+            username_element = WebDriverWait(driver, timeout).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, ".e-9921-text.encore-text-headline-large.encore-internal-color-text-base"))
             )
             username = username_element.text.strip()
@@ -91,127 +378,417 @@ def get_username(user_id, driver, timeout=20):
         print(f"Error getting username for {user_id}: {e}")
         return user_id
 
+def fetch_user_in_page(user_id, driver, include_profile=True):
+    """Fetch a user's followers, following and (optionally) display name with fetch() calls
+    inside the logged-in page, without navigating. Returns None if the requests fail."""
+    try:
+        result = driver.execute_async_script(IN_PAGE_FETCH_SCRIPT, user_id, TOKEN_URL, PROFILE_API_URL, include_profile)
+    except Exception as e:
+        print(f"  In-page fetch failed for {user_id}: {e}")
+        return None
+    
+    if not result or result.get('error'):
+        print(f"  In-page fetch failed for {user_id}: {result and result.get('error')}")
+        return None
+    
+    profile = result.get('profile') or {}
+    return profile.get('name'), parse_profiles(result['followers']), parse_profiles(result['following'])
+
+def read_user_cards(driver):
+    """Read the name and ID of every user card in the current page's DOM"""
+    return [
+        {"name": title, "id": parse_id(card_id)}
+        for card_id, title in driver.execute_script(USER_CARDS_SCRIPT)
+    ]
+
+def collect_user_cards(driver):
+    """Scroll through a virtualised user list, collecting cards until scrolling stops revealing new ones"""
+    collected = {}
+    idle_scrolls = 0
+    while idle_scrolls < MAX_IDLE_SCROLLS:
+        found_new = False
+        for card in read_user_cards(driver):
+            if card["id"] not in collected:
+                collected[card["id"]] = card
+                found_new = True
+        
+        idle_scrolls = 0 if found_new else idle_scrolls + 1
+        driver.execute_script(SCROLL_SCRIPT)
+        time.sleep(SCROLL_PAUSE)
+    
+    return list(collected.values())
+
+def username_from_title(title):
+    """Read the display name from a followers page title ("Username – Followers | Spotify")"""
+    title = title.removesuffix(' | Spotify')
+    for separator in (' – ', ' - '):
+        name, found, suffix = title.rpartition(separator)
+        if found and name and suffix == 'Followers':
+            return name
+    return None
+
+def wait_for_list_page(driver, timeout):
+    """Wait until a followers/following page shows a card or its empty state"""
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located(LIST_RENDERED))
+
 def scrape_followers(user_id, driver, timeout=20):
-    """Scrape followers for a specific user"""
+    """Scrape followers for a specific user, returning None if the page could not be scraped"""
     followers_url = f"{BASE_URL}/user/{user_id}/followers"
     
     try:
-        # Set page load timeout
-        driver.set_page_load_timeout(timeout)
-        
         # Navigate to the followers URL
         driver.get(followers_url)
         
-        # Wait for the page to be fully loaded
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        
-        # Additional wait to ensure dynamic content is loaded
-        time.sleep(2)
+        # Wait for the list to render rather than a fixed delay
+        wait_for_list_page(driver, timeout)
         
-        # Get the page source (HTML)
-        html_content = driver.page_source
-        soup = BeautifulSoup(html_content, 'html.parser')
-
-        # Find all 'p' tags with id starting with 'card-title-spotify:user'
-        matches = soup.find_all('p', id=lambda x: x and x.startswith('card-title-spotify:user'))
-
-        # Extract the 'title' attribute values and IDs
-        followers = []
-        for tag in matches:
-            if 'title' in tag.attrs:
-                follower_data = {
-                    "name": tag['title'],
-                    "id": parse_id(tag['id'])
-                }
-                followers.append(follower_data)
-        
-        return followers
+        # Query the rendered DOM directly, scrolling so users past the first screen are included
+        return collect_user_cards(driver)
     
     except TimeoutException:
-        print(f"Page load timed out after {timeout} seconds for user {user_id}")
-        return []
+        print(f"Followers page did not load within {timeout} seconds for user {user_id}")
+        return None
     except Exception as e:
         print(f"Error scraping followers for {user_id}: {e}")
-        return []
+        return None
 
 def scrape_following(user_id, driver, timeout=20):
-    """Scrape following for a specific user"""
+    """Scrape following for a specific user, returning None if the page could not be scraped"""
     following_url = f"{BASE_URL}/user/{user_id}/following"
     
     try:
-        # Set page load timeout
-        driver.set_page_load_timeout(timeout)
-        
         # Navigate to the following URL
         driver.get(following_url)
         
-        # Wait for the page to be fully loaded
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.TAG_NAME, "body"))
-        )
-        
-        # Additional wait to ensure dynamic content is loaded
-        time.sleep(2)
+        # Wait for the list to render rather than a fixed delay
+        wait_for_list_page(driver, timeout)
         
-        # Attempt to click on friends button
+        # Attempt to click on friends button; user cards may only render once artists are filtered out
         try:
             friends_button = WebDriverWait(driver, 2).until(
                 EC.element_to_be_clickable((By.XPATH, "//button[@data-encore-id='chip']//span[contains(text(), 'Friends')]/.."))
             )
             friends_button.click()
             print(f"  Clicked friends button for user {user_id}")
-            time.sleep(0.5)  # Wait for content to load after clicking
         except Exception as e:
             print(f"  Could not find or click friends button for user {user_id}: {e}")
+        else:
+            # The filtered list re-renders; if no user cards show up, only artists are followed
+            try:
+                WebDriverWait(driver, FRIENDS_FILTER_TIMEOUT).until(EC.presence_of_all_elements_located(USER_CARD))
+            except TimeoutException:
+                return []
         
-        # Get the page source (HTML)
-        html_content = driver.page_source
-        soup = BeautifulSoup(html_content, 'html.parser')
-
-        # Find all 'p' tags with id starting with 'card-title-spotify:user'
-        matches = soup.find_all('p', id=lambda x: x and x.startswith('card-title-spotify:user'))
-
-        # Extract the 'title' attribute values and IDs
-        following = []
-        for tag in matches:
-            if 'title' in tag.attrs:
-                following_data = {
-                    "name": tag['title'],
-                    "id": parse_id(tag['id'])
-                }
-                following.append(following_data)
-        
-        return following
+        # Query the rendered DOM directly, scrolling so users past the first screen are included
+        return collect_user_cards(driver)
     
     except TimeoutException:
-        print(f"Page load timed out after {timeout} seconds for user {user_id}")
-        return []
+        print(f"Following page did not load within {timeout} seconds for user {user_id}")
+        return None
     except Exception as e:
         print(f"Error scraping following for {user_id}: {e}")
-        return []
+        return None
 
-def save_network_data(network_data, filename=OUTPUT_FILE):
-    """Save network data to JSON file"""
+def encode_json(data):
+    """Encode data as compact JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def encode_user(user_data):
+    """Encode one user as a JSON Lines record"""
+    return encode_json(user_data) + b"\n"
+
+def decode_json(data):
+    """Decode a JSON document, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def save_encoded_network_data(data, filename=OUTPUT_FILE, fsync=False):
+    """Save encoded network JSON, writing a temporary file and moving it over the old one
+    so an interrupted save never leaves a truncated file behind"""
+    temp_file = f"{filename}.tmp"
     try:
-        with open(filename, 'w', encoding='utf-8') as file:
-            json.dump(network_data, file, indent=2, ensure_ascii=False)
+        with open(temp_file, 'wb') as file:
+            file.write(data)
+            if fsync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temp_file, filename)
         print(f"Network data saved to {filename}")
     except Exception as e:
         print(f"Error saving network data: {e}")
 
+def save_network_data(network_data, filename=OUTPUT_FILE):
+    """Save network data to JSON file"""
+    if orjson is not None:
+        data = orjson.dumps(network_data, option=orjson.OPT_INDENT_2)
+    else:
+        data = json.dumps(network_data, indent=2, ensure_ascii=False).encode('utf-8')
+    save_encoded_network_data(data, filename)
+
 def load_existing_network_data(filename=OUTPUT_FILE):
     """Load existing network data if file exists"""
     try:
         if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as file:
-                return json.load(file)
+            with open(filename, 'rb') as file:
+                return decode_json(file.read())
     except Exception as e:
         print(f"Error loading existing network data: {e}")
     return {"users": []}
 
-def scrape_network(input_file, output_file=OUTPUT_FILE):
+def read_users_file(filename=USERS_FILE):
+    """Yield users from a JSON Lines file one at a time, skipping a truncated last line"""
+    with open(filename, 'rb') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield decode_json(line)
+            except ValueError:
+                print(f"Skipping malformed line in {filename}")
+
+def consolidate(users_file=USERS_FILE, output_file=OUTPUT_FILE):
+    """Write the users collected in the JSON Lines file as the {"users": [...]} file read by process_graph.py"""
+    # A user written twice keeps its latest record
+    users = {user["user_id"]: user for user in read_users_file(users_file)}
+    save_network_data({"users": list(users.values())}, output_file)
+    
+    # Mark the users file as newer, so only a network.json written since then gets merged back in
+    os.utime(users_file)
+
+def truncate_partial_line(filename, block_size=65536):
+    """Cut a JSON Lines file back to its last newline, dropping a partially written record"""
+    with open(filename, 'r+b') as file:
+        end = file.seek(0, os.SEEK_END)
+        keep = 0
+        position = end
+        while position > 0:
+            start = max(0, position - block_size)
+            file.seek(start)
+            newline = file.read(position - start).rfind(b"\n")
+            if newline != -1:
+                keep = start + newline + 1
+                break
+            position = start
+        
+        if keep != end:
+            print(f"Dropping a partially written record at the end of {filename}")
+            file.truncate(keep)
+
+class JsonlNetworkWriter:
+    """Appends each scraped user as one line to a JSON Lines file, and its ID to a processed-users index.
+    The display names seen in followers/following lists are saved on close, so startup never parses the users."""
+    
+    def __init__(self, filename=USERS_FILE, output_file=OUTPUT_FILE,
+                 processed_file=PROCESSED_FILE, usernames_file=USERNAMES_FILE):
+        self.filename = filename
+        self.output_file = output_file
+        self.processed_file = processed_file
+        self.usernames_file = usernames_file
+        self.username_cache = None
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        
+        # consolidate() leaves the users file newer than network.json, so a newer network.json
+        # was written by an older run or a --compact run, and may hold users the users file lacks
+        carry_over = os.path.exists(output_file) and (
+            not os.path.exists(filename) or os.path.getmtime(output_file) > os.path.getmtime(filename)
+        )
+        
+        # A crash mid-write leaves a partial last line that the next user would be appended onto
+        created = not os.path.exists(filename)
+        if not created:
+            truncate_partial_line(filename)
+        
+        # Unbuffered, so each user reaches the file in a single write
+        self._fp = open(filename, 'ab', buffering=0)
+        
+        if carry_over:
+            saved = {user["user_id"] for user in read_users_file(filename)}
+            for user in load_existing_network_data(output_file).get("users", []):
+                if user["user_id"] not in saved:
+                    self._fp.write(encode_user(user))
+        
+        # The username cache is saved after the users file on close, so an older (or missing) one means
+        # the last run crashed or the users file changed since; rebuild both side files in one pass
+        if (created or not os.path.exists(processed_file) or not os.path.exists(usernames_file)
+                or os.path.getmtime(usernames_file) < os.path.getmtime(filename)):
+            self._rebuild_progress()
+        else:
+            truncate_partial_line(processed_file)
+        self._processed_fp = open(processed_file, 'a', encoding='utf-8', buffering=1)
+    
+    def _rebuild_progress(self):
+        """Rewrite the processed-users index and username cache from the users file"""
+        print(f"Rebuilding {self.processed_file} and {self.usernames_file} from {self.filename}")
+        self.username_cache = {}
+        with open(self.processed_file, 'w', encoding='utf-8') as file:
+            for user in read_users_file(self.filename):
+                file.write(user["user_id"] + "\n")
+                add_usernames(self.username_cache, user["followers"])
+                add_usernames(self.username_cache, user["following"])
+        self._save_usernames()
+    
+    def _save_usernames(self):
+        """Save the username cache, replacing the old file only once the new one is written"""
+        temp_file = f"{self.usernames_file}.tmp"
+        with open(temp_file, 'wb') as file:
+            file.write(encode_json(self.username_cache))
+        os.replace(temp_file, self.usernames_file)
+    
+    def load_progress(self):
+        """Return the IDs of users already written and the username cache, without parsing the users file.
+        The returned cache is the one saved on close, so names added to it are kept for the next run."""
+        with open(self.processed_file, 'r', encoding='utf-8') as file:
+            processed_users = set(file.read().splitlines())
+        if self.username_cache is None:
+            with open(self.usernames_file, 'rb') as file:
+                self.username_cache = decode_json(file.read())
+        return processed_users, self.username_cache
+    
+    def append(self, user_data):
+        # The user record goes first so the index never lists a user that wasn't saved
+        self._fp.write(encode_user(user_data))
+        self._processed_fp.write(user_data["user_id"] + "\n")
+    
+    def close(self):
+        """Close the files and write the consolidated network file and username cache"""
+        self._fp.close()
+        self._processed_fp.close()
+        consolidate(self.filename, self.output_file)
+        
+        # Left out, the cache is older than the users file and gets rebuilt by the next run
+        if self.username_cache is not None:
+            try:
+                self._save_usernames()
+            except Exception as e:
+                print(f"Error saving the username cache: {e}")
+
+class CompactNetworkWriter:
+    """Rewrites the whole network JSON file after every user, encoding each user only once"""
+    
+    def __init__(self, filename=OUTPUT_FILE):
+        self.filename = filename
+        self.existing = load_existing_network_data(filename).get("users", [])
+        self._encoded_users = [encode_json(user) for user in self.existing]
+        self._unsynced = 0
+    
+    def load_progress(self):
+        """Return the IDs of users that were in the file when the writer was created,
+        and the display names seen in their followers/following lists"""
+        processed_users = set()
+        username_cache = {}
+        for user in self.existing:
+            processed_users.add(user["user_id"])
+            add_usernames(username_cache, user["followers"])
+            add_usernames(username_cache, user["following"])
+        return processed_users, username_cache
+    
+    def append(self, user_data):
+        self._encoded_users.append(encode_json(user_data))
+        
+        # The file is replaced whole, so a crashed save keeps the previous version. Syncing to disk
+        # on every user is slow, so only every FSYNC_EVERY-th save is flushed past the OS cache.
+        self._unsynced += 1
+        fsync = self._unsynced >= FSYNC_EVERY
+        if fsync:
+            self._unsynced = 0
+        save_encoded_network_data(b'{"users":[' + b','.join(self._encoded_users) + b']}', self.filename, fsync)
+    
+    def close(self):
+        pass
+
+def add_usernames(username_cache, people):
+    """Remember the display names from a followers/following list"""
+    for person in people:
+        username_cache.setdefault(person["id"], person["name"])
+
+def build_user_data(user_id, username, followers, following):
+    """Assemble the record stored for one scraped user"""
+    return {
+        "user_id": user_id,
+        "username": username,
+        "followers": followers,
+        "following": following,
+        "follower_count": len(followers),
+        "following_count": len(following)
+    }
+
+def process_user(user_id, pool, username_cache):
+    """Collect the username, followers and following of a single user with a browser.
+    Returns None if the followers or following could not be scraped."""
+    driver = pool.get()
+    cached_username = username_cache.get(user_id)
+    
+    # Calling the API from inside the page needs no navigation at all
+    fetched = fetch_user_in_page(user_id, driver, include_profile=cached_username is None)
+    if fetched is not None:
+        username, followers, following = fetched
+        time.sleep(2)
+        return build_user_data(user_id, cached_username or username or user_id, followers, following)
+    
+    # Otherwise scrape the followers and following pages
+    # The followers page title carries the display name, saving a profile page load;
+    # most users already showed up in someone else's followers/following with their name anyway
+    followers = scrape_followers(user_id, driver)
+    if followers is None:
+        return None
+    username = cached_username or username_from_title(driver.title) or get_username(user_id, driver)
+    following = scrape_following(user_id, driver)
+    if following is None:
+        return None
+    
+    # Small delay between requests to be respectful
+    time.sleep(2)
+    
+    return build_user_data(user_id, username, followers, following)
+
+async def fetch_user(user_id, client, semaphore, username_cache):
+    """Collect the username, followers and following of a single user via the API.
+    Returns None if the followers or following could not be fetched."""
+    async with semaphore:
+        # Most users already showed up in someone else's followers/following with their name
+        username = username_cache.get(user_id)
+        lookups = [fetch_profiles(user_id, 'followers', client), fetch_profiles(user_id, 'following', client)]
+        if username is None:
+            lookups.append(fetch_username(user_id, client))
+        
+        try:
+            followers, following, *fetched = await asyncio.gather(*lookups)
+        except Exception as e:
+            # Saving empty lists would mark the user as processed; leave it for the next run instead
+            print(f"Error processing {user_id}: {e}")
+            return None
+        username = username or fetched[0]
+        
+        # Small delay between requests to be respectful
+        await asyncio.sleep(2)
+    
+    return build_user_data(user_id, username, followers, following)
+
+async def scrape_users_async(pending, cookies, username_cache, save_user):
+    """Fetch all pending users through the API with bounded concurrency.
+    Returns False without doing anything if no access token could be obtained."""
+    client = await create_api_client(cookies)
+    if client is None:
+        return False
+    
+    print("Using the Spotify API for followers and following")
+    semaphore = asyncio.Semaphore(API_CONCURRENCY)
+    try:
+        tasks = [asyncio.create_task(fetch_user(user_id, client, semaphore, username_cache)) for user_id in pending]
+        
+        # save_user runs on the event loop between awaits, so writes never interleave
+        for done, task in enumerate(asyncio.as_completed(tasks), 1):
+            user_data = await task
+            if user_data is not None:
+                save_user(user_data, done)
+    finally:
+        await client.aclose()
+    return True
+
+def scrape_network(input_file, output_file=OUTPUT_FILE, compact=False):
     """Main function to scrape network data for multiple users"""
     user_ids = read_user_ids_from_file(input_file)
     
@@ -221,71 +798,70 @@ def scrape_network(input_file, output_file=OUTPUT_FILE):
     
     print(f"Found {len(user_ids)} user IDs to process")
     
-    # Load existing data or create new structure
-    network_data = load_existing_network_data(output_file)
-    if "users" not in network_data:
-        network_data = {"users": []}
+    driver = setup_driver()
     
-    # Keep track of already processed users
-    processed_users = {user["user_id"] for user in network_data["users"]}
+    # Open Spotify homepage and continue as soon as the user is logged in
+    login(driver)
+    cookies = driver.get_cookies()
+    print("Starting scraping process...")
     
-    driver = setup_driver()
+    # Users are appended to a JSON Lines file as they finish, unless the old
+    # rewrite-everything writer is requested with --compact
+    writer = CompactNetworkWriter(output_file) if compact else JsonlNetworkWriter(USERS_FILE, output_file)
     
-    # Open Spotify homepage and wait for manual login
-    print("Opening Spotify homepage...")
-    driver.get(BASE_URL)
-    print("Please log in to Spotify manually in the browser window.")
-    print("You have 60 seconds to log in...")
+    # Keep track of already processed users, and the display names seen in their followers/following
+    processed_users, username_cache = writer.load_progress()
     
-    for remaining in range(60, 0, -1):
-        print(f"Starting scraping in {remaining} seconds...", end='\r')
-        time.sleep(1)
-    print("\nStarting scraping process...")
+    pending = []
+    for user_id in dict.fromkeys(user_ids):
+        if user_id in processed_users:
+            print(f"Skipping {user_id} (already processed)")
+        else:
+            pending.append(user_id)
+    
+    def save_user(user_data, done):
+        """Report and save one finished user"""
+        print(f"Processed user {done}/{len(pending)}: {user_data['user_id']}")
+        print(f"  Username: {user_data['username']}")
+        print(f"  Found {user_data['follower_count']} followers")
+        print(f"  Found {user_data['following_count']} following")
+        
+        # Save progress after each user
+        writer.append(user_data)
+        processed_users.add(user_data["user_id"])
+        add_usernames(username_cache, user_data["followers"])
+        add_usernames(username_cache, user_data["following"])
     
+    # In browser mode users run on a thread pool where each worker gets its own driver
+    pool = DriverPool(cookies)
+    executor = None
     try:
-        for i, user_id in enumerate(user_ids, 1):
-            if user_id in processed_users:
-                print(f"Skipping {user_id} (already processed)")
-                continue
-                
-            print(f"Processing user {i}/{len(user_ids)}: {user_id}")
-            
-            # Get username from profile page
-            username = get_username(user_id, driver)
-            print(f"  Username: {username}")
-            
-            # Scrape followers
-            followers = scrape_followers(user_id, driver)
-            print(f"  Found {len(followers)} followers")
-            
-            # Scrape following
-            following = scrape_following(user_id, driver)
-            print(f"  Found {len(following)} following")
-            
-            # Add to network data
-            user_data = {
-                "user_id": user_id,
-                "username": username,
-                "followers": followers,
-                "following": following,
-                "follower_count": len(followers),
-                "following_count": len(following)
-            }
+        # Use the API directly when possible; the browser is then only needed for login
+        if not asyncio.run(scrape_users_async(pending, cookies, username_cache, save_user)):
+            executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+            futures = {executor.submit(process_user, user_id, pool, username_cache): user_id for user_id in pending}
             
-            network_data["users"].append(user_data)
-            processed_users.add(user_id)
-            
-            # Save progress after each user
-            save_network_data(network_data, output_file)
-            
-            # Small delay between requests to be respectful
-            time.sleep(2)
+            # Results are collected here on the main thread, so the writer needs no locking
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    user_data = future.result()
+                except Exception as e:
+                    print(f"Error processing {futures[future]}: {e}")
+                    continue
+                # Saving empty lists would mark the user as processed; leave it for the next run instead
+                if user_data is not None:
+                    save_user(user_data, done)
             
     except KeyboardInterrupt:
         print("\nScraping interrupted by user")
     except Exception as e:
         print(f"Unexpected error: {e}")
     finally:
+        # Let in-flight users finish before their drivers are closed
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+        pool.quit()
         driver.quit()
         print("Browser closed")
 
@@ -293,13 +869,15 @@ def main():
     """Main entry point"""
     print(f"Input file: {INPUT_FILE}")
     print(f"Output file: {OUTPUT_FILE}")
+    if '--compact' not in sys.argv[1:]:
+        print(f"Progress file: {USERS_FILE}")
     
     if not os.path.exists(INPUT_FILE):
         print(f"Error: Input file '{INPUT_FILE}' does not exist")
         print("Please create the input file with user IDs (one per line)")
         return
     
-    scrape_network(INPUT_FILE, OUTPUT_FILE)
+    scrape_network(INPUT_FILE, OUTPUT_FILE, compact='--compact' in sys.argv[1:])
 
 if __name__ == "__main__":
     main()